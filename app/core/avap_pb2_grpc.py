@@ -44,6 +44,16 @@ class DefinitionEngineStub(object):
                 request_serializer=avap__pb2.Empty.SerializeToString,
                 response_deserializer=avap__pb2.CatalogResponse.FromString,
                 _registered_method=True)
+        self.SyncCatalogSince = channel.unary_unary(
+                '/avap.DefinitionEngine/SyncCatalogSince',
+                request_serializer=avap__pb2.CatalogSyncRequest.SerializeToString,
+                response_deserializer=avap__pb2.CatalogResponse.FromString,
+                _registered_method=True)
+        self.WatchCatalog = channel.unary_stream(
+                '/avap.DefinitionEngine/WatchCatalog',
+                request_serializer=avap__pb2.CatalogSyncRequest.SerializeToString,
+                response_deserializer=avap__pb2.CatalogResponse.FromString,
+                _registered_method=True)
 
 
 class DefinitionEngineServicer(object):
@@ -63,6 +73,20 @@ class DefinitionEngineServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def SyncCatalogSince(self, request, context):
+        """Get only the definitions changed since the catalog version the worker holds
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def WatchCatalog(self, request, context):
+        """Stream of catalog deltas: the first one against the request, then one per change
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_DefinitionEngineServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -76,6 +100,16 @@ def add_DefinitionEngineServicer_to_server(servicer, server):
                     request_deserializer=avap__pb2.Empty.FromString,
                     response_serializer=avap__pb2.CatalogResponse.SerializeToString,
             ),
+            'SyncCatalogSince': grpc.unary_unary_rpc_method_handler(
+                    servicer.SyncCatalogSince,
+                    request_deserializer=avap__pb2.CatalogSyncRequest.FromString,
+                    response_serializer=avap__pb2.CatalogResponse.SerializeToString,
+            ),
+            'WatchCatalog': grpc.unary_stream_rpc_method_handler(
+                    servicer.WatchCatalog,
+                    request_deserializer=avap__pb2.CatalogSyncRequest.FromString,
+                    response_serializer=avap__pb2.CatalogResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'avap.DefinitionEngine', rpc_method_handlers)
@@ -140,3 +174,57 @@ class DefinitionEngine(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def SyncCatalogSince(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/avap.DefinitionEngine/SyncCatalogSince',
+            avap__pb2.CatalogSyncRequest.SerializeToString,
+            avap__pb2.CatalogResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def WatchCatalog(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/avap.DefinitionEngine/WatchCatalog',
+            avap__pb2.CatalogSyncRequest.SerializeToString,
+            avap__pb2.CatalogResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -109,6 +109,8 @@ elif op == "<=": res = (v1 <= v2)
 elif op == "!=": res = (str(v1) != str(v2))
 
 branch = "true" if res else "false"
+# The worker runs the chosen branch itself
+task["branch"] = branch
 if branch in task["branches"]:
     for step in task["branches"][branch]:
         self.process_step(step)
@@ -180,7 +182,6 @@ $body$),
     'RequestGet', 
     '[{"item":"url","type":"variable"},{"item":"querystring","type":"variable"},{"item":"headers","type":"variable"},{"item":"o_result","type":"variable"}]',
     $body$
-import requests
 import json
 
 def resolve(val):
@@ -207,20 +208,10 @@ url = str(raw_url).strip()
 params = ensure_dict(raw_qs)
 headers = ensure_dict(raw_head)
 
-# 2. Ejecución (Sin el try/except interno que se come el error)
-response = requests.get(url, params=params, headers=headers, timeout=30)
-
-# CLAVE: Si el código es 4xx o 5xx, lanza una excepción que captura el Executor
-response.raise_for_status() 
-
-try:
-    result_data = response.json()
-except:
-    result_data = response.text
-
-# 3. Guardar resultado
-if target_var:
-    self.conector.variables[target_var] = result_data
+# 2. Ejecución asíncrona con el cliente HTTP del worker (pool keep-alive).
+# Si el código es 4xx o 5xx, el Executor lanza la excepción al recoger la respuesta.
+# 3. El resultado (JSON o texto) se guarda en target_var
+self.http.get(url, params=params, headers=headers, target=target_var, timeout=30)
 $body$
 ),
 
@@ -234,7 +225,6 @@ $body$
         {"item":"o_result","type":"variable"}
     ]',
     $body$
-import requests
 import json
 
 # --- 1. HELPERS (Consistentes con RequestGet) ---
@@ -284,26 +274,16 @@ elif isinstance(raw_body, str):
         # Si falla, es string plano/raw data
         is_json = False
 
-# --- 4. EJECUCIÓN ---
-result_data = None
-try:
-    if is_json:
-        # requests.post con 'json=' añade auto Content-Type: application/json
-        response = requests.post(url, params=params, json=body_data, headers=headers, timeout=30)
-    else:
-        # Se envía como x-www-form-urlencoded o raw string
-        response = requests.post(url, params=params, data=body_data, headers=headers, timeout=30)
-    
-    try:
-        result_data = response.json()
-    except:
-        result_data = response.text
-except Exception as e:
-    result_data = {"error": str(e)}
-
-# --- 5. GUARDADO ---
-if target_var:
-    self.conector.variables[target_var] = result_data
+# --- 4. EJECUCIÓN Y GUARDADO ---
+# Asíncrona (cliente HTTP del worker); un error se guarda como {"error": ...}
+if is_json:
+    # 'json=' añade auto Content-Type: application/json
+    self.http.post(url, params=params, json=body_data, headers=headers, target=target_var,
+                   timeout=30, check_status=False, raise_errors=False)
+else:
+    # Se envía como x-www-form-urlencoded o raw string
+    self.http.post(url, params=params, data=body_data, headers=headers, target=target_var,
+                   timeout=30, check_status=False, raise_errors=False)
 $body$
 ),
 
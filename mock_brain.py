@@ -3,19 +3,42 @@ import struct
 import hmac
 import hashlib
 import json
+import marshal
+import importlib.util
+import threading
+from functools import lru_cache
 from concurrent import futures
 from app.core import avap_pb2, avap_pb2_grpc
 
 # PACKING LOGIC 
-def pack_for_lsp(python_code):
+# v2 package: the source travels compiled (marshal) with the metadata, so workers
+# running the same Python skip compile(). Cached: marshal output is not stable
+# between calls and the commands are fixed once published.
+@lru_cache(maxsize=None)
+def pack_for_lsp(name, interface, python_code, command_type, parallel_safe=False):
     MAGIC = b'AVAP'
-    VERSION = 1
+    VERSION = 2
     SECRET = b'avap_secure_signature_key_2026'
-    payload = python_code.encode('utf-8')
-    header = struct.pack('>4sHI', MAGIC, VERSION, len(payload))
+    source = python_code.encode('utf-8')
+    code = marshal.dumps(compile(python_code, f"<cmd:{name}>", "exec"))
+    meta = json.dumps({
+        'interface': json.loads(interface) if interface else [],
+        'type': command_type,
+        'heavy': command_type in ('io', 'heavy'),
+        'parallel_safe': parallel_safe,
+        'hash': hashlib.sha256(source).hexdigest(),
+    }, separators=(',', ':')).encode('utf-8')
+    header = struct.pack('>4sH4sIII', MAGIC, VERSION, importlib.util.MAGIC_NUMBER,
+                         len(meta), len(source), len(code))
+    payload = meta + source + code
     signature = hmac.new(SECRET, header + payload, hashlib.sha256).digest()
     return header + signature + payload
 
+def pack_command(name):
+    interface, code = COMMANDS_DB[name]
+    return pack_for_lsp(name, interface, code, COMMAND_TYPES.get(name, "function"),
+                        name in PARALLEL_SAFE)
+
 # COMMAND LOGIC 
 
 # Mini-Executor
@@ -175,6 +198,8 @@ elif op == '>=': res = (v1 >= v2)
 elif op == '<=': res = (v1 <= v2)
 
 branch = 'true' if res else 'false'
+# The worker runs the chosen branch itself
+task['branch'] = branch
 
 if branch in task.get('branches', {}):
     for s in task['branches'][branch]:
@@ -184,7 +209,6 @@ if branch in task.get('branches', {}):
     "RequestGet": (
         '[{"item":"url","type":"variable"},{"item":"querystring","type":"variable"},{"item":"headers","type":"variable"},{"item":"o_result","type":"variable"}]',
         """
-import requests
 import json
 props = task['properties']
 
@@ -208,13 +232,8 @@ target = task.get('context') or props.get('o_result') or props.get('3') or 'res'
 if 'error500' in url:
     raise Exception("Simulated HTTP 500")
 
-r = requests.get(url, params=qs, headers=headers, timeout=5)
-r.raise_for_status()
-
-try: data = r.json()
-except: data = r.text
-
-self.conector.variables[target] = data
+# Pooled, non-blocking: the worker stores the response in 'target'
+self.http.get(url, params=qs, headers=headers, target=target, timeout=5)
         """
     ),
     "try": (
@@ -240,30 +259,97 @@ self.conector.try_level -= 1
     "endLoop": ("[]", "pass")
 }
 
+# Notified on every catalog change, wakes up WatchCatalog streams
+CATALOG_CHANGED = threading.Condition()
+
+def publish_command(name, interface, code):
+    COMMANDS_DB[name] = (interface, code)
+    with CATALOG_CHANGED:
+        CATALOG_CHANGED.notify_all()
+
+def remove_command(name):
+    COMMANDS_DB.pop(name, None)
+    with CATALOG_CHANGED:
+        CATALOG_CHANGED.notify_all()
+
+def catalog_hashes():
+    # Per-command hash over the interface and source, and a catalog version over all of them
+    hashes = {
+        name: hashlib.sha256(interface.encode('utf-8') + code.encode('utf-8')).hexdigest()[:16]
+        for name, (interface, code) in COMMANDS_DB.items()
+    }
+    digest = hashlib.sha256()
+    for name in sorted(hashes):
+        digest.update(f"{name}:{hashes[name]};".encode('utf-8'))
+    return hashes, digest.hexdigest()[:16]
+
+# Commands the worker must run in its sandbox ('io' / 'heavy')
+COMMAND_TYPES = {}
+
+# Commands that only read their arguments and only write their target: the worker
+# may run consecutive independent calls to them concurrently
+PARALLEL_SAFE = {'RequestGet'}
+
 class MockBrain(avap_pb2_grpc.DefinitionEngineServicer):
+    def _add_command(self, resp, name, command_hash):
+        interface, code = COMMANDS_DB[name]
+        c = resp.commands.add()
+        c.name = name
+        c.interface_json = interface
+        c.code = pack_command(name)
+        c.type = COMMAND_TYPES.get(name, "function")
+        c.hash = command_hash
+
     def SyncCatalog(self, request, context):
+        hashes, version_hash = catalog_hashes()
         resp = avap_pb2.CatalogResponse()
-        for name, (interface, code) in COMMANDS_DB.items():
-            c = resp.commands.add()
-            c.name = name
-            c.interface_json = interface
-            c.code = pack_for_lsp(code)
-            c.type = "function"
-            c.hash = "v-final-ok"
+        for name in COMMANDS_DB:
+            self._add_command(resp, name, hashes[name])
         resp.total_count = len(COMMANDS_DB)
-        resp.version_hash = "v-final-ok"
+        resp.version_hash = version_hash
         return resp
 
+    def _catalog_delta(self, known, hashes, version_hash):
+        resp = avap_pb2.CatalogResponse(total_count=len(hashes), version_hash=version_hash)
+        for name, command_hash in hashes.items():
+            if known.get(name) != command_hash:
+                self._add_command(resp, name, command_hash)
+        resp.removed.extend(name for name in known if name not in hashes)
+        return resp
+
+    def _catalog_since(self, request, hashes, version_hash):
+        if request.version_hash == version_hash:
+            return avap_pb2.CatalogResponse(
+                total_count=len(hashes), version_hash=version_hash, unchanged=True
+            )
+        return self._catalog_delta(request.known_hashes, hashes, version_hash)
+
+    def SyncCatalogSince(self, request, context):
+        hashes, version_hash = catalog_hashes()
+        return self._catalog_since(request, hashes, version_hash)
+
+    def WatchCatalog(self, request, context):
+        # First message tells the worker it is subscribed, even with no changes
+        known, version = catalog_hashes()
+        yield self._catalog_since(request, known, version)
+        while context.is_active():
+            with CATALOG_CHANGED:
+                CATALOG_CHANGED.wait(timeout=1)
+            hashes, version_hash = catalog_hashes()
+            if version_hash != version:
+                yield self._catalog_delta(known, hashes, version_hash)
+                known, version = hashes, version_hash
+
     def GetCommand(self, request, context):
         name = request.name
         if name in COMMANDS_DB:
             interface, code = COMMANDS_DB[name]
             return avap_pb2.CommandResponse(
                 name=name,
-                type="function",
+                type=COMMAND_TYPES.get(name, "function"),
                 interface_json=interface,
-                code=pack_for_lsp(code),
-                hash="v-final-ok"
+                code=pack_command(name),
+                hash=catalog_hashes()[0][name]
             )
         else:
             context.set_code(grpc.StatusCode.NOT_FOUND)
@@ -1,4 +1,21 @@
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
+use pyo3::types::{PyBool, PyDict, PyFloat, PyLong, PyString};
+use std::sync::Arc;
+use std::time::{Duration, Instant};
+
+mod vm;
+
+use vm::{Exit, Value};
+
+// Exit codes returned by Machine.run (VM_* constants in main.py)
+const EXIT_DONE: u8 = 0;
+const EXIT_CALL: u8 = 1;
+const EXIT_EVAL: u8 = 2;
+const EXIT_BRANCH: u8 = 3;
+const EXIT_STEPS: u8 = 4;
+const EXIT_TIME: u8 = 5;
+const EXIT_ERROR: u8 = 6;
 
 /// Formats a sum as a string for Python.
 #[pyfunction]
@@ -6,9 +23,166 @@ fn sum_as_string(a: usize, b: usize) -> PyResult<String> {
     Ok((a + b).to_string())
 }
 
+/// Python -> VM value; anything the core cannot represent stays in `opaque`.
+fn to_value(value: &PyAny, opaque: &mut Vec<PyObject>) -> Value {
+    if value.is_none() {
+        return Value::None;
+    }
+    if let Ok(b) = value.downcast::<PyBool>() {
+        return Value::Bool(b.is_true());
+    }
+    if value.is_exact_instance_of::<PyLong>() {
+        if let Ok(i) = value.extract::<i64>() {
+            return Value::Int(i);
+        }
+    } else if value.is_exact_instance_of::<PyFloat>() {
+        if let Ok(f) = value.extract::<f64>() {
+            return Value::Float(f);
+        }
+    } else if value.is_exact_instance_of::<PyString>() {
+        if let Ok(s) = value.extract::<&str>() {
+            return Value::Str(Arc::from(s));
+        }
+    }
+    opaque.push(value.into());
+    Value::Opaque((opaque.len() - 1) as u32)
+}
+
+fn to_object(py: Python, value: &Value, opaque: &[PyObject]) -> PyObject {
+    match value {
+        Value::None => py.None(),
+        Value::Bool(b) => b.into_py(py),
+        Value::Int(i) => i.into_py(py),
+        Value::Float(f) => f.into_py(py),
+        Value::Str(s) => s.as_ref().into_py(py),
+        Value::Opaque(i) => opaque[*i as usize].clone_ref(py),
+    }
+}
+
+/// Instruction buffer lowered from a script plan, shared by every run.
+#[pyclass(frozen)]
+struct Program {
+    inner: Arc<vm::Program>,
+}
+
+#[pymethods]
+impl Program {
+    #[new]
+    fn new(code: Vec<(u8, i64, i64, i64)>, constants: &PyAny, slots: Vec<Option<String>>) -> PyResult<Self> {
+        let mut opaque = Vec::new();
+        let constants: Vec<Value> = constants
+            .iter()?
+            .map(|item| item.map(|item| to_value(item, &mut opaque)))
+            .collect::<PyResult<_>>()?;
+        if !opaque.is_empty() {
+            return Err(PyValueError::new_err("program constants must be None, bool, int, float or str"));
+        }
+        let slots = slots.into_iter().map(|name| name.map(Arc::from)).collect();
+        let inner = vm::Program::new(&code, constants, slots).map_err(PyValueError::new_err)?;
+        Ok(Program { inner: Arc::new(inner) })
+    }
+
+    fn __len__(&self) -> usize {
+        self.inner.code.len()
+    }
+}
+
+/// One execution of a Program over a request's variables.
+#[pyclass]
+struct Machine {
+    program: Arc<vm::Program>,
+    state: vm::Machine,
+    opaque: Vec<PyObject>,
+}
+
+#[pymethods]
+impl Machine {
+    #[new]
+    fn new(program: &Program, variables: &PyDict) -> PyResult<Self> {
+        let mut machine = Machine {
+            program: program.inner.clone(),
+            state: vm::Machine::new(&program.inner),
+            opaque: Vec::new(),
+        };
+        machine.load_variables(variables)?;
+        Ok(machine)
+    }
+
+    /// Runs with the GIL released until the program ends or Python has to step
+    /// in. Returns (exit code, argument): the plan op or expression index to
+    /// handle, or the error message.
+    fn run(&mut self, py: Python, steps_left: i64, remaining_ms: Option<f64>) -> (u8, PyObject) {
+        let deadline = remaining_ms.map(|ms| Instant::now() + Duration::from_secs_f64(ms.clamp(0.0, 1e9) / 1000.0));
+        self.state.steps_left = steps_left;
+        let program = &*self.program;
+        let state = &mut self.state;
+        let exit = py.allow_threads(|| state.run(program, deadline));
+        match exit {
+            Exit::Done => (EXIT_DONE, py.None()),
+            Exit::Call(op) => (EXIT_CALL, op.into_py(py)),
+            Exit::Eval(expr) => (EXIT_EVAL, expr.into_py(py)),
+            Exit::Branch(op) => (EXIT_BRANCH, op.into_py(py)),
+            Exit::StepsExceeded => (EXIT_STEPS, py.None()),
+            Exit::TimeExceeded => (EXIT_TIME, py.None()),
+            Exit::Error(message) => (EXIT_ERROR, message.into_py(py)),
+        }
+    }
+
+    /// Value computed by Python for an EVAL or BRANCH exit.
+    fn push(&mut self, value: &PyAny) {
+        let value = to_value(value, &mut self.opaque);
+        self.state.push(value);
+    }
+
+    /// Abandons the current top-level statement (error inside `try`).
+    fn skip_statement(&mut self) {
+        self.state.skip_statement();
+    }
+
+    fn load_variables(&mut self, variables: &PyDict) -> PyResult<()> {
+        for (name, value) in variables.iter() {
+            // Non-string keys cannot be named by a script
+            if let Ok(name) = name.extract::<&str>() {
+                let value = to_value(value, &mut self.opaque);
+                self.state.set_variable(name, value);
+            }
+        }
+        Ok(())
+    }
+
+    fn forget(&mut self, name: &str) {
+        self.state.forget(name);
+    }
+
+    /// Variables written by the program since the last call.
+    fn take_changes<'py>(&mut self, py: Python<'py>) -> PyResult<&'py PyDict> {
+        let out = PyDict::new(py);
+        for (name, value) in self.state.take_changes() {
+            out.set_item(name.as_ref(), to_object(py, &value, &self.opaque))?;
+        }
+        Ok(out)
+    }
+
+    /// Results added since the last call, in insertion order.
+    fn take_results<'py>(&mut self, py: Python<'py>) -> PyResult<&'py PyDict> {
+        let out = PyDict::new(py);
+        for (name, value) in std::mem::take(&mut self.state.results) {
+            out.set_item(name.as_ref(), to_object(py, &value, &self.opaque))?;
+        }
+        Ok(out)
+    }
+
+    #[getter]
+    fn steps_left(&self) -> i64 {
+        self.state.steps_left
+    }
+}
+
 /// A Python module implemented in Rust.
 #[pymodule]
 fn avap_lite_core(_py: Python, m: &PyModule) -> PyResult<()> {
     m.add_function(wrap_pyfunction!(sum_as_string, m)?)?;
+    m.add_class::<Program>()?;
+    m.add_class::<Machine>()?;
     Ok(())
 }
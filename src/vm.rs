@@ -0,0 +1,861 @@
+//! Interpreter core of the AVAP VM.
+//!
+//! It only knows Rust types, so `lib.rs` runs it with the GIL released. The
+//! program is a flat instruction buffer produced by the Python executor from a
+//! compiled script plan; the machine evaluates it over typed slots and a value
+//! stack. Whatever the core cannot decide exactly like CPython (catalog
+//! commands, exotic operands, big integers...) suspends the machine: Python does
+//! that piece of work, pushes the outcome if there is one, and resumes it.
+
+use std::collections::HashMap;
+use std::sync::Arc;
+use std::time::Instant;
+
+#[derive(Clone, Debug, PartialEq)]
+pub enum Value {
+    None,
+    Bool(bool),
+    Int(i64),
+    Float(f64),
+    Str(Arc<str>),
+    /// A Python object the core cannot look into (index in the binding's table)
+    Opaque(u32),
+}
+
+// Opcodes, shared with the Python lowering (NATIVE_* constants in main.py)
+pub const CONST: u8 = 0;
+pub const LOAD: u8 = 1;
+pub const LOAD_OR: u8 = 2;
+pub const STORE: u8 = 3;
+pub const BINARY: u8 = 4;
+pub const NEGATE: u8 = 5;
+pub const EXPR_BEGIN: u8 = 6;
+pub const EXPR_END: u8 = 7;
+pub const COMPARE: u8 = 8;
+pub const JUMP_IF_FALSE: u8 = 9;
+pub const JUMP: u8 = 10;
+pub const TO_INT: u8 = 11;
+pub const LOOP_NEXT: u8 = 12;
+pub const STATEMENT: u8 = 13;
+pub const STEP: u8 = 14;
+pub const ADD_RESULT: u8 = 15;
+pub const CALL: u8 = 16;
+pub const EVAL: u8 = 17;
+pub const SETTLE: u8 = 18;
+
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub enum BinOp {
+    Add,
+    Sub,
+    Mul,
+    Div,
+    Mod,
+}
+
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub enum CmpOp {
+    Eq,
+    Ne,
+    Gt,
+    Lt,
+    Ge,
+    Le,
+    /// Unknown comparator: the catalog `if` takes the false branch
+    Never,
+}
+
+#[derive(Clone, Copy, Debug, PartialEq)]
+pub enum Op {
+    /// Push constants[i]
+    Const(u32),
+    /// Push a slot; an unset slot aborts the enclosing expression
+    Load(u32),
+    /// Push a slot, or constants[c] when unset (`variables.get(raw, raw)`)
+    LoadOr(u32, u32),
+    Store(u32),
+    Binary(BinOp),
+    Negate,
+    /// Start of an expression Python can evaluate by itself (expressions[e]);
+    /// on any failure the stack is unwound and Python takes over, then the
+    /// machine continues at `end`
+    ExprBegin { expr: u32, end: u32 },
+    ExprEnd,
+    /// Catalog `if` comparison of the two top values; undecidable operands
+    /// suspend with `Branch(op)` and Python pushes the outcome
+    Compare { cmp: CmpOp, op: u32 },
+    JumpIfFalse(u32),
+    Jump(u32),
+    /// `int()` of the top value (loop bounds)
+    ToInt,
+    /// Loop header: when counter <= end, var = counter, counter += 1, one step
+    /// is charged and the next instruction is skipped; otherwise execution
+    /// falls through to it (the JUMP out of the loop)
+    LoopNext { counter: u32, end: u32, var: u32 },
+    /// Start of a top-level statement ending at `end`
+    Statement { end: u32 },
+    /// Charges one step for an op run by the VM (Python charges the ops it runs)
+    Step,
+    /// results[key] = slot, or the key itself when unset (`addResult`)
+    AddResult { slot: u32, key: u32 },
+    /// Python runs plan op `op` (a catalog command)
+    Call(u32),
+    /// Python evaluates expressions[e] and pushes the value
+    Eval(u32),
+    /// `addVar` post-processing of a string value: one naming a variable is
+    /// replaced by it, one with arithmetic is handed to Python as `Call(op)`
+    /// (which also stores it and charges the step) and the machine continues
+    /// at `after`
+    Settle { op: u32, after: u32 },
+}
+
+pub struct Program {
+    pub code: Vec<Op>,
+    pub constants: Vec<Value>,
+    /// Slot names; None for hidden slots (loop counters and bounds)
+    pub slots: Vec<Option<Arc<str>>>,
+}
+
+impl Program {
+    /// Builds a program from (opcode, a, b, c) tuples, checking every index
+    pub fn new(raw: &[(u8, i64, i64, i64)], constants: Vec<Value>, slots: Vec<Option<Arc<str>>>) -> Result<Program, String> {
+        let code_len = raw.len() as i64;
+        let slot = |i: i64| -> Result<u32, String> {
+            if i < 0 || i as usize >= slots.len() {
+                return Err(format!("slot {} out of range", i));
+            }
+            Ok(i as u32)
+        };
+        let constant = |i: i64| -> Result<u32, String> {
+            if i < 0 || i as usize >= constants.len() {
+                return Err(format!("constant {} out of range", i));
+            }
+            Ok(i as u32)
+        };
+        let target = |i: i64| -> Result<u32, String> {
+            if i < 0 || i > code_len {
+                return Err(format!("jump target {} out of range", i));
+            }
+            Ok(i as u32)
+        };
+        let index = |i: i64| -> Result<u32, String> {
+            if i < 0 || i > u32::MAX as i64 {
+                return Err(format!("index {} out of range", i));
+            }
+            Ok(i as u32)
+        };
+
+        let mut code = Vec::with_capacity(raw.len());
+        for &(opcode, a, b, c) in raw {
+            let op = match opcode {
+                CONST => Op::Const(constant(a)?),
+                LOAD => Op::Load(slot(a)?),
+                LOAD_OR => Op::LoadOr(slot(a)?, constant(b)?),
+                STORE => Op::Store(slot(a)?),
+                BINARY => Op::Binary(match a {
+                    0 => BinOp::Add,
+                    1 => BinOp::Sub,
+                    2 => BinOp::Mul,
+                    3 => BinOp::Div,
+                    4 => BinOp::Mod,
+                    _ => return Err(format!("unknown binary operator {}", a)),
+                }),
+                NEGATE => Op::Negate,
+                EXPR_BEGIN => Op::ExprBegin { expr: index(a)?, end: target(b)? },
+                EXPR_END => Op::ExprEnd,
+                COMPARE => Op::Compare {
+                    cmp: match a {
+                        0 => CmpOp::Eq,
+                        1 => CmpOp::Ne,
+                        2 => CmpOp::Gt,
+                        3 => CmpOp::Lt,
+                        4 => CmpOp::Ge,
+                        5 => CmpOp::Le,
+                        _ => CmpOp::Never,
+                    },
+                    op: index(b)?,
+                },
+                JUMP_IF_FALSE => Op::JumpIfFalse(target(a)?),
+                JUMP => Op::Jump(target(a)?),
+                TO_INT => Op::ToInt,
+                LOOP_NEXT => Op::LoopNext { counter: slot(a)?, end: slot(b)?, var: slot(c)? },
+                STATEMENT => Op::Statement { end: target(a)? },
+                STEP => Op::Step,
+                ADD_RESULT => Op::AddResult { slot: slot(a)?, key: constant(b)? },
+                CALL => Op::Call(index(a)?),
+                EVAL => Op::Eval(index(a)?),
+                SETTLE => Op::Settle { op: index(a)?, after: target(b)? },
+                _ => return Err(format!("unknown opcode {}", opcode)),
+            };
+            code.push(op);
+        }
+        Ok(Program { code, constants, slots })
+    }
+}
+
+#[derive(Debug, PartialEq)]
+pub enum Exit {
+    Done,
+    /// Python runs plan op `n`; nothing is pushed back
+    Call(u32),
+    /// Python evaluates expression `n` and pushes its value
+    Eval(u32),
+    /// Python decides the catalog `if` of plan op `n` and pushes a Bool
+    Branch(u32),
+    StepsExceeded,
+    TimeExceeded,
+    Error(String),
+}
+
+struct ExprFrame {
+    height: usize,
+    expr: u32,
+    end: u32,
+}
+
+pub struct Machine {
+    pub slots: Vec<Option<Value>>,
+    /// Slots written by the program since the last `take_changes`
+    dirty: Vec<bool>,
+    changed: Vec<u32>,
+    /// Slot of every named variable, script names first, then the inputs
+    pub names: HashMap<Arc<str>, u32>,
+    pub slot_names: Vec<Option<Arc<str>>>,
+    pub results: Vec<(Arc<str>, Value)>,
+    pub steps_left: i64,
+    stack: Vec<Value>,
+    exprs: Vec<ExprFrame>,
+    pc: usize,
+    statement_end: usize,
+}
+
+const TIME_CHECK_MASK: i64 = 63;
+const MAX_EXACT_FLOAT_INT: i64 = 1 << 53;
+const MAX_STRING_BYTES: usize = 1 << 20;
+
+impl Machine {
+    pub fn new(program: &Program) -> Machine {
+        let mut names = HashMap::with_capacity(program.slots.len());
+        for (i, name) in program.slots.iter().enumerate() {
+            if let Some(name) = name {
+                names.insert(name.clone(), i as u32);
+            }
+        }
+        Machine {
+            slots: vec![None; program.slots.len()],
+            dirty: vec![false; program.slots.len()],
+            changed: Vec::new(),
+            names,
+            slot_names: program.slots.clone(),
+            results: Vec::new(),
+            steps_left: i64::MAX,
+            stack: Vec::with_capacity(16),
+            exprs: Vec::new(),
+            pc: 0,
+            statement_end: program.code.len(),
+        }
+    }
+
+    /// Sets a variable from Python, adding a slot for names the script does
+    /// not mention. Not reported back by `take_changes`.
+    pub fn set_variable(&mut self, name: &str, value: Value) {
+        match self.names.get(name) {
+            Some(&slot) => self.slots[slot as usize] = Some(value),
+            None => {
+                let name: Arc<str> = Arc::from(name);
+                self.names.insert(name.clone(), self.slots.len() as u32);
+                self.slot_names.push(Some(name));
+                self.slots.push(Some(value));
+                self.dirty.push(false);
+            }
+        }
+    }
+
+    /// Unsets a variable deleted by Python
+    pub fn forget(&mut self, name: &str) {
+        if let Some(&slot) = self.names.get(name) {
+            self.slots[slot as usize] = None;
+        }
+    }
+
+    fn write(&mut self, slot: u32, value: Value) {
+        let index = slot as usize;
+        self.slots[index] = Some(value);
+        if !self.dirty[index] && self.slot_names[index].is_some() {
+            self.dirty[index] = true;
+            self.changed.push(slot);
+        }
+    }
+
+    /// Named variables written by the program since the last call
+    pub fn take_changes(&mut self) -> Vec<(Arc<str>, Value)> {
+        let mut out = Vec::with_capacity(self.changed.len());
+        for slot in std::mem::take(&mut self.changed) {
+            let index = slot as usize;
+            self.dirty[index] = false;
+            if let (Some(name), Some(value)) = (&self.slot_names[index], &self.slots[index]) {
+                out.push((name.clone(), value.clone()));
+            }
+        }
+        out
+    }
+
+    /// Value pushed back by Python after an Eval or Branch exit
+    pub fn push(&mut self, value: Value) {
+        self.stack.push(value);
+    }
+
+    /// Abandons the current top-level statement (an error caught by `try`)
+    pub fn skip_statement(&mut self) {
+        self.stack.clear();
+        self.exprs.clear();
+        self.pc = self.statement_end;
+    }
+
+    fn charge(&mut self, deadline: Option<Instant>) -> Option<Exit> {
+        self.steps_left -= 1;
+        if self.steps_left < 0 {
+            return Some(Exit::StepsExceeded);
+        }
+        if self.steps_left & TIME_CHECK_MASK == 0 {
+            if let Some(deadline) = deadline {
+                if Instant::now() > deadline {
+                    return Some(Exit::TimeExceeded);
+                }
+            }
+        }
+        None
+    }
+
+    fn slot(&self, name: &str) -> Option<&Value> {
+        self.names.get(name).and_then(|&slot| self.slots[slot as usize].as_ref())
+    }
+
+    /// Unwinds the innermost expression so Python evaluates it
+    fn abort_expression(&mut self) -> Exit {
+        match self.exprs.pop() {
+            Some(frame) => {
+                self.stack.truncate(frame.height);
+                self.pc = frame.end as usize;
+                Exit::Eval(frame.expr)
+            }
+            None => Exit::Error("expression failed outside of an expression block".to_string()),
+        }
+    }
+
+    /// Runs until the program ends or Python has to step in
+    pub fn run(&mut self, program: &Program, deadline: Option<Instant>) -> Exit {
+        let code = &program.code;
+        while self.pc < code.len() {
+            let op = code[self.pc];
+            self.pc += 1;
+            match op {
+                Op::Const(i) => self.stack.push(program.constants[i as usize].clone()),
+                Op::Load(slot) => match &self.slots[slot as usize] {
+                    Some(value) => self.stack.push(value.clone()),
+                    None => return self.abort_expression(),
+                },
+                Op::LoadOr(slot, fallback) => {
+                    let value = match &self.slots[slot as usize] {
+                        Some(value) => value.clone(),
+                        None => program.constants[fallback as usize].clone(),
+                    };
+                    self.stack.push(value);
+                }
+                Op::Store(slot) => {
+                    let value = self.stack.pop().unwrap_or(Value::None);
+                    self.write(slot, value);
+                }
+                Op::Binary(bin) => {
+                    let b = self.stack.pop().unwrap_or(Value::None);
+                    let a = self.stack.pop().unwrap_or(Value::None);
+                    match binary(bin, &a, &b) {
+                        Some(value) => self.stack.push(value),
+                        None => return self.abort_expression(),
+                    }
+                }
+                Op::Negate => {
+                    let value = match self.stack.pop().unwrap_or(Value::None) {
+                        Value::Int(i) => i.checked_neg().map(Value::Int),
+                        Value::Bool(b) => Some(Value::Int(-(b as i64))),
+                        Value::Float(f) => Some(Value::Float(-f)),
+                        _ => None,
+                    };
+                    match value {
+                        Some(value) => self.stack.push(value),
+                        None => return self.abort_expression(),
+                    }
+                }
+                Op::ExprBegin { expr, end } => self.exprs.push(ExprFrame { height: self.stack.len(), expr, end }),
+                Op::ExprEnd => {
+                    self.exprs.pop();
+                }
+                Op::Compare { cmp, op } => {
+                    let b = self.stack.pop().unwrap_or(Value::None);
+                    let a = self.stack.pop().unwrap_or(Value::None);
+                    match compare(cmp, &a, &b) {
+                        Some(result) => self.stack.push(Value::Bool(result)),
+                        None => return Exit::Branch(op),
+                    }
+                }
+                Op::JumpIfFalse(target) => {
+                    if let Some(Value::Bool(false)) = self.stack.pop() {
+                        self.pc = target as usize;
+                    }
+                }
+                Op::Jump(target) => self.pc = target as usize,
+                Op::ToInt => {
+                    let value = self.stack.pop().unwrap_or(Value::None);
+                    match to_int(&value) {
+                        Ok(i) => self.stack.push(Value::Int(i)),
+                        Err(message) => return Exit::Error(message),
+                    }
+                }
+                Op::LoopNext { counter, end, var } => {
+                    let (Some(Value::Int(i)), Some(Value::Int(last))) =
+                        (&self.slots[counter as usize], &self.slots[end as usize])
+                    else {
+                        return Exit::Error("loop bounds are not integers".to_string());
+                    };
+                    let (i, last) = (*i, *last);
+                    if i > last {
+                        continue;
+                    }
+                    if let Some(exit) = self.charge(deadline) {
+                        return exit;
+                    }
+                    self.write(var, Value::Int(i));
+                    self.slots[counter as usize] = Some(match i.checked_add(1) {
+                        Some(next) => Value::Int(next),
+                        None => return Exit::Error("loop counter overflow".to_string()),
+                    });
+                    self.pc += 1;
+                }
+                Op::Statement { end } => self.statement_end = end as usize,
+                Op::Step => {
+                    if let Some(exit) = self.charge(deadline) {
+                        return exit;
+                    }
+                }
+                Op::AddResult { slot, key } => {
+                    let value = match &self.slots[slot as usize] {
+                        Some(value) => value.clone(),
+                        None => program.constants[key as usize].clone(),
+                    };
+                    let Value::Str(key) = &program.constants[key as usize] else {
+                        return Exit::Error("result key is not a string".to_string());
+                    };
+                    match self.results.iter_mut().find(|(name, _)| name == key) {
+                        Some(entry) => entry.1 = value,
+                        None => self.results.push((key.clone(), value)),
+                    }
+                }
+                Op::Call(op) => return Exit::Call(op),
+                Op::Eval(expr) => return Exit::Eval(expr),
+                Op::Settle { op, after } => {
+                    if let Some(Value::Str(s)) = self.stack.last() {
+                        if s.contains(['+', '-', '*', '/']) {
+                            self.stack.pop();
+                            self.pc = after as usize;
+                            // Python runs (and charges) the whole op again
+                            self.steps_left += 1;
+                            return Exit::Call(op);
+                        }
+                        if let Some(value) = self.slot(s).cloned() {
+                            self.stack.pop();
+                            self.stack.push(value);
+                        }
+                    }
+                }
+            }
+        }
+        Exit::Done
+    }
+}
+
+fn as_number(value: &Value) -> Option<Value> {
+    match value {
+        Value::Bool(b) => Some(Value::Int(*b as i64)),
+        Value::Int(_) | Value::Float(_) => Some(value.clone()),
+        _ => None,
+    }
+}
+
+/// Exact int -> float conversion, None when CPython could round differently
+fn exact_float(i: i64) -> Option<f64> {
+    if (-MAX_EXACT_FLOAT_INT..=MAX_EXACT_FLOAT_INT).contains(&i) {
+        Some(i as f64)
+    } else {
+        None
+    }
+}
+
+/// CPython semantics for the supported operand types; None hands the
+/// expression to Python (type errors, overflow, division by zero...)
+pub fn binary(op: BinOp, a: &Value, b: &Value) -> Option<Value> {
+    match (a, b) {
+        (Value::Str(x), Value::Str(y)) if op == BinOp::Add => {
+            if x.len() + y.len() > MAX_STRING_BYTES {
+                return None;
+            }
+            let mut s = String::with_capacity(x.len() + y.len());
+            s.push_str(x);
+            s.push_str(y);
+            Some(Value::Str(Arc::from(s)))
+        }
+        (Value::Str(s), n) | (n, Value::Str(s)) if op == BinOp::Mul => {
+            let times = match n {
+                Value::Int(i) => *i,
+                Value::Bool(b) => *b as i64,
+                _ => return None,
+            };
+            let times = times.max(0) as usize;
+            if s.len().checked_mul(times)? > MAX_STRING_BYTES {
+                return None;
+            }
+            Some(Value::Str(Arc::from(s.repeat(times))))
+        }
+        _ => {
+            let (a, b) = (as_number(a)?, as_number(b)?);
+            match (a, b) {
+                (Value::Int(x), Value::Int(y)) => match op {
+                    BinOp::Add => x.checked_add(y).map(Value::Int),
+                    BinOp::Sub => x.checked_sub(y).map(Value::Int),
+                    BinOp::Mul => x.checked_mul(y).map(Value::Int),
+                    BinOp::Div => {
+                        if y == 0 {
+                            return None;
+                        }
+                        Some(Value::Float(exact_float(x)? / exact_float(y)?))
+                    }
+                    BinOp::Mod => {
+                        if y == 0 {
+                            return None;
+                        }
+                        let r = x.checked_rem(y)?;
+                        Some(Value::Int(if r != 0 && ((r < 0) != (y < 0)) { r + y } else { r }))
+                    }
+                },
+                (x, y) => {
+                    let x = match x {
+                        Value::Int(i) => exact_float(i)?,
+                        Value::Float(f) => f,
+                        _ => return None,
+                    };
+                    let y = match y {
+                        Value::Int(i) => exact_float(i)?,
+                        Value::Float(f) => f,
+                        _ => return None,
+                    };
+                    match op {
+                        BinOp::Add => Some(Value::Float(x + y)),
+                        BinOp::Sub => Some(Value::Float(x - y)),
+                        BinOp::Mul => Some(Value::Float(x * y)),
+                        BinOp::Div => {
+                            if y == 0.0 {
+                                return None;
+                            }
+                            Some(Value::Float(x / y))
+                        }
+                        BinOp::Mod => {
+                            if y == 0.0 {
+                                return None;
+                            }
+                            let r = x % y;
+                            Some(Value::Float(if r == 0.0 {
+                                0.0f64.copysign(y)
+                            } else if (r < 0.0) != (y < 0.0) {
+                                r + y
+                            } else {
+                                r
+                            }))
+                        }
+                    }
+                }
+            }
+        }
+    }
+}
+
+/// Python `repr()` of a float
+pub fn py_float_repr(x: f64) -> String {
+    if x.is_nan() {
+        return "nan".to_string();
+    }
+    if x.is_infinite() {
+        return if x > 0.0 { "inf" } else { "-inf" }.to_string();
+    }
+    if x == 0.0 {
+        return if x.is_sign_negative() { "-0.0" } else { "0.0" }.to_string();
+    }
+    // Shortest round-trip digits, then CPython's layout rules
+    let sci = format!("{:e}", x);
+    let (mantissa, exp) = sci.split_once('e').unwrap_or((&sci, "0"));
+    let exp: i32 = exp.parse().unwrap_or(0);
+    let (negative, mantissa) = match mantissa.strip_prefix('-') {
+        Some(m) => (true, m),
+        None => (false, mantissa),
+    };
+    let digits: String = mantissa.chars().filter(|c| *c != '.').collect();
+
+    let mut out = String::with_capacity(digits.len() + 8);
+    if negative {
+        out.push('-');
+    }
+    if !(-4..16).contains(&exp) {
+        out.push_str(&digits[..1]);
+        if digits.len() > 1 {
+            out.push('.');
+            out.push_str(&digits[1..]);
+        }
+        out.push('e');
+        out.push(if exp < 0 { '-' } else { '+' });
+        out.push_str(&format!("{:02}", exp.abs()));
+    } else if exp >= 0 {
+        let int_len = exp as usize + 1;
+        if digits.len() <= int_len {
+            out.push_str(&digits);
+            out.push_str(&"0".repeat(int_len - digits.len()));
+            out.push_str(".0");
+        } else {
+            out.push_str(&digits[..int_len]);
+            out.push('.');
+            out.push_str(&digits[int_len..]);
+        }
+    } else {
+        out.push_str("0.");
+        out.push_str(&"0".repeat((-exp - 1) as usize));
+        out.push_str(&digits);
+    }
+    out
+}
+
+/// Python `str()` of a value, None for opaque objects
+fn py_str(value: &Value) -> Option<String> {
+    match value {
+        Value::None => Some("None".to_string()),
+        Value::Bool(b) => Some(if *b { "True" } else { "False" }.to_string()),
+        Value::Int(i) => Some(i.to_string()),
+        Value::Float(f) => Some(py_float_repr(*f)),
+        Value::Str(s) => Some(s.to_string()),
+        Value::Opaque(_) => None,
+    }
+}
+
+/// Operand normalisation of the catalog `if`:
+/// `float(v) if '.' in str(v) else int(v)`, falling back to the unquoted text
+fn if_operand(value: &Value) -> Option<Value> {
+    match value {
+        Value::Int(_) => Some(value.clone()),
+        Value::Bool(b) => Some(Value::Int(*b as i64)),
+        Value::None => Some(Value::Str(Arc::from("None"))),
+        Value::Float(f) => {
+            let text = py_float_repr(*f);
+            if text.contains('.') {
+                Some(value.clone())
+            } else if f.is_finite() {
+                // '1e+20': int() of it, exact only within i64
+                if f.abs() < 9.2e18 {
+                    Some(Value::Int(*f as i64))
+                } else {
+                    None
+                }
+            } else {
+                Some(Value::Str(Arc::from(text)))
+            }
+        }
+        Value::Str(s) => {
+            // Underscores and non-ASCII digits are valid for CPython only
+            if !s.is_ascii() || s.contains('_') {
+                return None;
+            }
+            let trimmed = s.trim();
+            if s.contains('.') {
+                if let Ok(f) = trimmed.parse::<f64>() {
+                    return Some(Value::Float(f));
+                }
+            } else if !trimmed.is_empty() && trimmed.trim_start_matches(['+', '-']).bytes().all(|c| c.is_ascii_digit()) {
+                // Digits that do not fit an i64 are a Python int
+                return trimmed.parse::<i64>().ok().map(Value::Int);
+            }
+            let unquoted = s.trim_matches('"').trim_matches('\'');
+            Some(Value::Str(Arc::from(unquoted)))
+        }
+        Value::Opaque(_) => None,
+    }
+}
+
+/// Catalog `if` comparison, None when only Python can decide (or raise)
+pub fn compare(cmp: CmpOp, a: &Value, b: &Value) -> Option<bool> {
+    let a = if_operand(a)?;
+    let b = if_operand(b)?;
+    let ordering = match cmp {
+        CmpOp::Eq => return Some(py_str(&a)? == py_str(&b)?),
+        CmpOp::Ne => return Some(py_str(&a)? != py_str(&b)?),
+        CmpOp::Never => return Some(false),
+        _ => match (&a, &b) {
+            (Value::Int(x), Value::Int(y)) => x.partial_cmp(y),
+            (Value::Str(x), Value::Str(y)) => x.partial_cmp(y),
+            (Value::Int(x), Value::Float(y)) => exact_float(*x)?.partial_cmp(y),
+            (Value::Float(x), Value::Int(y)) => x.partial_cmp(&exact_float(*y)?),
+            (Value::Float(x), Value::Float(y)) => x.partial_cmp(y),
+            // str vs number: TypeError, raised by Python
+            _ => return None,
+        },
+    };
+    let Some(ordering) = ordering else {
+        // NaN: every ordering comparison is false
+        return Some(false);
+    };
+    Some(match cmp {
+        CmpOp::Gt => ordering.is_gt(),
+        CmpOp::Lt => ordering.is_lt(),
+        CmpOp::Ge => ordering.is_ge(),
+        CmpOp::Le => ordering.is_le(),
+        _ => false,
+    })
+}
+
+/// Python `int()` of a loop bound
+pub fn to_int(value: &Value) -> Result<i64, String> {
+    match value {
+        Value::Int(i) => Ok(*i),
+        Value::Bool(b) => Ok(*b as i64),
+        Value::Float(f) if f.is_finite() && f.abs() < 9.2e18 => Ok(f.trunc() as i64),
+        Value::Float(f) if f.is_nan() => Err("cannot convert float NaN to integer".to_string()),
+        Value::Float(_) => Err("cannot convert float infinity to integer".to_string()),
+        Value::Str(s) => s
+            .trim()
+            .parse::<i64>()
+            .map_err(|_| format!("invalid literal for int() with base 10: '{}'", s)),
+        Value::None => Err("int() argument must be a string, a bytes-like object or a real number, not 'NoneType'".to_string()),
+        Value::Opaque(_) => Err("int() argument must be a string, a bytes-like object or a real number".to_string()),
+    }
+}
+
+#[cfg(test)]
+mod tests {
+    use super::*;
+
+    // pyo3 requires #[pyclass] types to be Send; Program is also shared across threads
+    #[test]
+    fn thread_safety() {
+        fn check<T: Send + Sync>() {}
+        check::<Program>();
+        check::<Machine>();
+    }
+
+    fn s(text: &str) -> Value {
+        Value::Str(Arc::from(text))
+    }
+
+    fn names(list: &[Option<&str>]) -> Vec<Option<Arc<str>>> {
+        list.iter().map(|n| n.map(Arc::from)).collect()
+    }
+
+    #[test]
+    fn float_repr_matches_python() {
+        assert_eq!(py_float_repr(3.0), "3.0");
+        assert_eq!(py_float_repr(0.1 + 0.2), "0.30000000000000004");
+        assert_eq!(py_float_repr(1e16), "1e+16");
+        assert_eq!(py_float_repr(1.5e-5), "1.5e-05");
+        assert_eq!(py_float_repr(0.0001), "0.0001");
+        assert_eq!(py_float_repr(-123.456), "-123.456");
+        assert_eq!(py_float_repr(1234567890123456.0), "1234567890123456.0");
+    }
+
+    #[test]
+    fn arithmetic_follows_python() {
+        assert_eq!(binary(BinOp::Mod, &Value::Int(-7), &Value::Int(3)), Some(Value::Int(2)));
+        assert_eq!(binary(BinOp::Div, &Value::Int(7), &Value::Int(2)), Some(Value::Float(3.5)));
+        assert_eq!(binary(BinOp::Add, &s("T-"), &s("3")), Some(s("T-3")));
+        assert_eq!(binary(BinOp::Mul, &s("ab"), &Value::Int(2)), Some(s("abab")));
+        assert_eq!(binary(BinOp::Add, &s("a"), &Value::Int(1)), None);
+        assert_eq!(binary(BinOp::Div, &Value::Int(1), &Value::Int(0)), None);
+        assert_eq!(binary(BinOp::Mul, &Value::Int(i64::MAX), &Value::Int(2)), None);
+        assert_eq!(binary(BinOp::Mod, &Value::Float(-1.0), &Value::Float(3.0)), Some(Value::Float(2.0)));
+    }
+
+    #[test]
+    fn if_comparisons_follow_the_catalog() {
+        assert_eq!(compare(CmpOp::Eq, &s("admin"), &s("admin")), Some(true));
+        assert_eq!(compare(CmpOp::Eq, &Value::Int(3), &s("3")), Some(true));
+        assert_eq!(compare(CmpOp::Eq, &Value::Float(3.0), &Value::Int(3)), Some(false));
+        assert_eq!(compare(CmpOp::Gt, &s("4"), &Value::Int(0)), Some(true));
+        assert_eq!(compare(CmpOp::Gt, &s("abc"), &Value::Int(0)), None);
+        assert_eq!(compare(CmpOp::Never, &Value::Int(1), &Value::Int(1)), Some(false));
+        assert_eq!(compare(CmpOp::Lt, &Value::Opaque(0), &Value::Int(1)), None);
+    }
+
+    #[test]
+    fn runs_a_loop_with_results() {
+        // addVar(total, 0)  startLoop(i, 1, 4) total = total + i endLoop()  addResult(total)
+        let constants = vec![Value::Int(0), Value::Int(1), Value::Int(4), s("total")];
+        let slots = names(&[Some("total"), Some("i"), None, None]);
+        let raw = vec![
+            (STATEMENT, 3, 0, 0),
+            (CONST, 0, 0, 0),
+            (STORE, 0, 0, 0),
+            (STATEMENT, 20, 0, 0),
+            (CONST, 1, 0, 0),
+            (TO_INT, 0, 0, 0),
+            (STORE, 2, 0, 0),
+            (CONST, 2, 0, 0),
+            (TO_INT, 0, 0, 0),
+            (STORE, 3, 0, 0),
+            (LOOP_NEXT, 2, 3, 1),
+            (JUMP, 20, 0, 0),
+            (STEP, 0, 0, 0),
+            (EXPR_BEGIN, 0, 18, 0),
+            (LOAD, 0, 0, 0),
+            (LOAD, 1, 0, 0),
+            (BINARY, 0, 0, 0),
+            (EXPR_END, 0, 0, 0),
+            (STORE, 0, 0, 0),
+            (JUMP, 10, 0, 0),
+            (STATEMENT, 22, 0, 0),
+            (ADD_RESULT, 0, 3, 0),
+        ];
+        let program = Program::new(&raw, constants, slots).unwrap();
+        let mut machine = Machine::new(&program);
+        assert_eq!(machine.run(&program, None), Exit::Done);
+        assert_eq!(machine.results, vec![(Arc::from("total"), Value::Int(10))]);
+        assert_eq!(
+            machine.take_changes(),
+            vec![(Arc::from("total"), Value::Int(10)), (Arc::from("i"), Value::Int(4))]
+        );
+        assert!(machine.take_changes().is_empty());
+        // 4 iterations + 4 body steps
+        assert_eq!(machine.steps_left, i64::MAX - 8);
+    }
+
+    #[test]
+    fn budget_and_suspensions() {
+        let constants = vec![s("x"), Value::Int(1)];
+        let slots = names(&[Some("x")]);
+        let raw = vec![
+            (STATEMENT, 6, 0, 0),
+            (STEP, 0, 0, 0),
+            (EXPR_BEGIN, 7, 5, 0),
+            (LOAD, 0, 0, 0),
+            (EXPR_END, 0, 0, 0),
+            (STORE, 0, 0, 0),
+            (STATEMENT, 8, 0, 0),
+            (STEP, 0, 0, 0),
+            (CALL, 2, 0, 0),
+        ];
+        let program = Program::new(&raw, constants, slots).unwrap();
+
+        // 'x' is unset: Python evaluates expression 7 and pushes the value
+        let mut machine = Machine::new(&program);
+        assert_eq!(machine.run(&program, None), Exit::Eval(7));
+        machine.push(Value::Int(5));
+        assert_eq!(machine.run(&program, None), Exit::Call(2));
+        assert_eq!(machine.run(&program, None), Exit::Done);
+        assert_eq!(machine.slots[0], Some(Value::Int(5)));
+
+        let mut machine = Machine::new(&program);
+        machine.set_variable("x", Value::Int(1));
+        machine.steps_left = 1;
+        assert_eq!(machine.run(&program, None), Exit::StepsExceeded);
+    }
+}
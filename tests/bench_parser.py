@@ -0,0 +1,55 @@
+import sys, os, time, statistics
+
+# --- CONFIGURACIÓN DE RUTAS ---
+current_file = os.path.abspath(__file__)
+project_root = os.path.dirname(os.path.dirname(current_file))
+src_path = os.path.join(project_root, "src")
+sys.path.insert(0, src_path)
+sys.path.insert(0, project_root)
+
+from main import AVAPParser
+
+# --- SCRIPT GRANDE: bloques, llamadas anidadas, cadenas y funciones ---
+BLOCK = """addParam("name", nombre)
+addVar(total, 0)
+function impuesto(base) {
+    return base * 1.21
+}
+if(nombre, None, "!=")
+    addVar(saludo, "Hola, mundo (v2)")
+    variableFromJSON(payload, "user.name", usuario)
+else()
+    addVar(saludo, 'anonimo')
+end()
+startLoop(i, 1, 10)
+    total = total + i
+    bruto = impuesto(total)
+endLoop()
+RequestGet("https://example.com/api?a=1", "", "", respuesta)
+addResult(saludo)
+addResult(bruto)
+"""
+
+def run_parser_benchmark(lines=2000, rounds=50):
+    script = BLOCK * (lines // BLOCK.count("\n"))
+    total_lines = script.count("\n")
+
+    print(f"🚀 Benchmarking PARSER ({total_lines} líneas, {rounds} rondas)")
+    latencies = []
+    for _ in range(rounds):
+        parser = AVAPParser()
+        t_start = time.perf_counter()
+        parser.parse(script)
+        latencies.append((time.perf_counter() - t_start) * 1000)
+
+    avg = statistics.mean(latencies)
+    print("\n" + "="*45)
+    print("📊 RESULTADO: PARSER")
+    print("="*45)
+    print(f"Latencia Promedio: {avg:.4f} ms")
+    print(f"Mediana:           {statistics.median(latencies):.4f} ms")
+    print(f"Líneas/segundo:    {total_lines / (avg / 1000):,.0f}")
+    print("="*45)
+
+if __name__ == "__main__":
+    run_parser_benchmark()
@@ -1,6 +1,10 @@
 import pytest
 import json
 import os
+import asyncio
+import time
+import hmac
+import hashlib
 import sys
 import tornado
 from tornado.testing import AsyncHTTPTestCase, gen_test
@@ -8,7 +12,7 @@ from tornado.web import Application
 
 # Add src to path
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
-from main import AVAPExecutor, ExecuteHandler, CompileHandler
+from main import AVAPExecutor, ExecuteHandler, BatchExecuteHandler, CompileHandler, PlanStore, PlanCache, BytecodePacker, CatalogCommand, NativeLowering, NATIVE_REFERENCE
 import asyncpg
 
 class TestAVAPFlow(AsyncHTTPTestCase):
@@ -22,6 +26,7 @@ class TestAVAPFlow(AsyncHTTPTestCase):
 
         return Application([
             (r"/api/v1/execute", ExecuteHandler, dict(executor=self.executor_obj)),
+            (r"/api/v1/execute/batch", BatchExecuteHandler, dict(executor=self.executor_obj)),
             (r"/api/v1/compile", CompileHandler, dict(executor=self.executor_obj)),
         ])
 
@@ -49,7 +54,8 @@ class TestAVAPFlow(AsyncHTTPTestCase):
         """Prueba básica de addVar con tipos numéricos y addResult"""
         payload = {
             "script": "addVar(numero, 123.45)\naddResult(numero)",
-            "variables": {}
+            "variables": {},
+            "include": ["variables"]
         }
         try:
             response = await self.http_client.fetch(self.get_url("/api/v1/execute"), method="POST", body=json.dumps(payload), headers={"Content-Type": "application/json"})
@@ -74,7 +80,7 @@ class TestAVAPFlow(AsyncHTTPTestCase):
         end()
         addResult(acceso)
         """
-        payload = {"script": script, "variables": {}}
+        payload = {"script": script, "variables": {}, "include": ["variables"]}
         response = await self.http_client.fetch(self.get_url("/api/v1/execute"), method="POST", body=json.dumps(payload))
         data = json.loads(response.body)
         assert data["variables"]["acceso"] == "concedido"
@@ -91,7 +97,7 @@ class TestAVAPFlow(AsyncHTTPTestCase):
         endLoop()
         addResult(ultimo_ticket)
         """
-        payload = {"script": script, "variables": {}}
+        payload = {"script": script, "variables": {}, "include": ["variables"]}
         response = await self.http_client.fetch(self.get_url("/api/v1/execute"), method="POST", body=json.dumps(payload))
         data = json.loads(response.body)
         # El último i es 3, por lo que el ticket debe ser T-3
@@ -128,7 +134,7 @@ class TestAVAPFlow(AsyncHTTPTestCase):
         """
         # Simulamos ?limit=4
         url = self.get_url("/api/v1/execute?limit=4")
-        payload = {"script": script, "variables": {}}
+        payload = {"script": script, "variables": {}, "include": ["variables"]}
         response = await self.http_client.fetch(url, method="POST", body=json.dumps(payload))
         data = json.loads(response.body)
         
@@ -292,4 +298,350 @@ class TestAVAPFlow(AsyncHTTPTestCase):
             assert row is not None
             assert len(row['bytecode']) > 0  # El bytecode no debe estar vacío
 
-    
+    @gen_test
+    async def test_13_isolated_execution_frames(self):
+        """Las variables de un script no deben filtrarse a otro script"""
+        first = self.execute_script("secreto = 41 + 1\naddResult(secreto)", {})
+        second = self.execute_script("copia = secreto + 0\naddResult(copia)", {})
+        res_first, res_second = await asyncio.gather(first, second)
+        assert res_first["results"]["secreto"] == 42
+        # Sin 'secreto' en su propio scope la expresion no se puede evaluar
+        assert res_second["results"]["copia"] == "secreto + 0"
+
+    @gen_test
+    async def test_14_execution_budget(self):
+        """Un bucle desbocado se corta por presupuesto de pasos con un 504"""
+        payload = {
+            "script": "startLoop(i, 1, 1000000)\n addVar(x, i)\nendLoop()\naddResult(x)",
+            "variables": {},
+            "budget": {"max_steps": 500}
+        }
+        response = await self.http_client.fetch(
+            self.get_url("/api/v1/execute"),
+            method="POST",
+            body=json.dumps(payload),
+            raise_error=False
+        )
+        assert response.code == 504
+        data = json.loads(response.body)
+        assert "budget exceeded" in data["error"]
+
+    @gen_test
+    async def test_15_syntax_error_position(self):
+        """Un error de sintaxis devuelve 400 con la línea y columna"""
+        payload = {
+            "script": "addVar(a, 1)\n  addVar(b, \"sin cerrar)\naddResult(a)",
+            "variables": {}
+        }
+        response = await self.http_client.fetch(
+            self.get_url("/api/v1/execute"),
+            method="POST",
+            body=json.dumps(payload),
+            raise_error=False
+        )
+        assert response.code == 400
+        data = json.loads(response.body)
+        assert "line 2, column" in data["error"]
+        assert "unterminated string" in data["error"]
+
+    def test_15_braces_inside_strings(self):
+        """Las llaves dentro de una cadena no abren ni cierran funciones"""
+        nodes = self.executor_obj.parser.parse(
+            'addVar(s, "}")\n'
+            'function f(a) {\n  addVar(t, "{")\n  return a\n}\n'
+            "addVar(n, 1_000)"
+        )
+        assert nodes[0]["properties"] == ["s", "}"]
+        assert nodes[1]["type"] == "function" and nodes[1]["ast"][0]["properties"] == ["t", "{"]
+        assert nodes[2]["properties"] == ["n", 1000]
+
+    @gen_test
+    async def test_16_persistent_plan_store(self):
+        """Un ejecutor nuevo recupera el script ya parseado del almacén en disco"""
+        import tempfile
+        script = "function doble(a){ return a * 2 }\naddVar(x, 4)\ny = doble(x)\naddResult(y)"
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "plans.db")
+            self.executor_obj.plan_store = PlanStore(path)
+            try:
+                first = await self.execute_script(script, {})
+                self.executor_obj.plan_store.flush()
+            finally:
+                self.executor_obj.plan_store.close()
+                self.executor_obj.plan_store = None
+
+            warm = AVAPExecutor(None)
+            warm.adopt_catalog(self.executor_obj)
+            warm.plan_store = PlanStore(path)
+            second = await warm.execute_script(script, {})
+            warm.plan_store.close()
+
+        assert first["results"]["y"] == second["results"]["y"] == 8
+        assert warm.plan_store.hits == 1
+
+    @gen_test
+    async def test_17_warm_up_compiles_hot_scripts(self):
+        """El calentamiento deja los scripts compilados antes del primer request"""
+        script = "addVar(calentado, 7)\naddResult(calentado)"
+        warmed = await self.executor_obj.warm_up([script])
+        assert warmed == 1
+
+        hits = self.executor_obj.plan_cache.hits
+        res = await self.execute_script(script, {})
+        assert res["results"]["calentado"] == 7
+        assert self.executor_obj.plan_cache.hits == hits + 1
+
+    @gen_test
+    async def test_18_batch_execution(self):
+        """Un script contra varios juegos de variables, cada uno aislado"""
+        payload = {
+            "script": "total = precio * 2\naddResult(total)",
+            "variables": [{"precio": 1}, {"precio": 5}, {}]
+        }
+        response = await self.http_client.fetch(
+            self.get_url("/api/v1/execute/batch"), method="POST", body=json.dumps(payload)
+        )
+        items = json.loads(response.body)["items"]
+        assert [item["status"] for item in items] == [200, 200, 200]
+        assert items[0]["result"]["total"] == 2
+        assert items[1]["result"]["total"] == 10
+        # Sin 'precio' la expresion no se evalua: no hereda nada del item anterior
+        assert items[2]["result"]["total"] == "precio * 2"
+
+        payload = {"scripts": ["addVar(a, 1)\naddResult(a)", "addVar(a, \"roto)"]}
+        response = await self.http_client.fetch(
+            self.get_url("/api/v1/execute/batch"), method="POST", body=json.dumps(payload)
+        )
+        items = json.loads(response.body)["items"]
+        assert items[0]["result"]["a"] == 1
+        assert items[1]["status"] == 400 and not items[1]["success"]
+
+        # Un presupuesto mal formado da 400 en cada item, no un 500 del lote
+        payload = {"scripts": ["addVar(a, 1)"], "budget": {"max_steps": "muchos"}}
+        response = await self.http_client.fetch(
+            self.get_url("/api/v1/execute/batch"), method="POST", body=json.dumps(payload)
+        )
+        items = json.loads(response.body)["items"]
+        assert items[0]["status"] == 400
+
+    @gen_test
+    async def test_18_batch_deadline(self):
+        """Los items comparten el tiempo del lote: agotado, el resto falla con 504 sin ejecutarse"""
+        from tornado.options import options
+        previous = options.max_batch_ms, options.max_steps
+        options.max_batch_ms, options.max_steps = 200, 10 ** 9
+        try:
+            payload = {"script": "startLoop(i, 1, 100000000)\n  x = i\nendLoop()", "variables": [{}, {}, {}]}
+            started = time.monotonic()
+            response = await self.http_client.fetch(
+                self.get_url("/api/v1/execute/batch"), method="POST", body=json.dumps(payload),
+                request_timeout=10
+            )
+            elapsed = time.monotonic() - started
+        finally:
+            options.max_batch_ms, options.max_steps = previous
+        items = json.loads(response.body)["items"]
+        assert [item["status"] for item in items] == [504, 504, 504]
+        assert "Batch execution budget exceeded" in items[2]["error"]
+        assert elapsed < 0.8
+        metrics = self.executor_obj.metrics
+        assert metrics["requests_total"] == 3 and metrics["rejects_timeout"] == 3
+
+    @gen_test
+    async def test_19_ndjson_streaming(self):
+        """Modo stream: una línea NDJSON por resultado y una línea final"""
+        payload = {
+            "script": "startLoop(i, 1, 3)\n  addVar(ultimo, i)\n  addResult(ultimo)\nendLoop()",
+            "variables": {},
+            "stream": True
+        }
+        response = await self.http_client.fetch(
+            self.get_url("/api/v1/execute"), method="POST", body=json.dumps(payload)
+        )
+        assert response.headers["Content-Type"] == "application/x-ndjson"
+        events = [json.loads(line) for line in response.body.decode().splitlines()]
+        assert [e["value"] for e in events if e["event"] == "result"] == [1, 2, 3]
+        assert events[-1]["event"] == "end" and events[-1]["status"] == 200
+
+    @gen_test
+    async def test_20_response_sections(self):
+        """Por defecto solo 'result'; variables y logs bajo petición"""
+        script = "addVar(a, 1)\naddResult(a)"
+        response = await self.http_client.fetch(
+            self.get_url("/api/v1/execute"), method="POST",
+            body=json.dumps({"script": script, "variables": {"entrada": 1}})
+        )
+        data = json.loads(response.body)
+        assert data == {"success": True, "result": {"a": 1}}
+
+        response = await self.http_client.fetch(
+            self.get_url("/api/v1/execute"), method="POST",
+            body=json.dumps({"script": script, "variables": {}, "include": ["variables", "logs"]})
+        )
+        data = json.loads(response.body)
+        assert data["variables"]["a"] == 1
+        assert [log["command"] for log in data["logs"]] == ["addVar", "addResult"]
+
+    @gen_test
+    async def test_21_scope_chain(self):
+        """Las funciones ven sus parámetros por encima de las globales, y los cambios de los comandos se leen al momento"""
+        script = (
+            "function f(a){\n"
+            "  r = a + base\n"
+            "  return r\n"
+            "}\n"
+            "a = 1\n"
+            "addVar(a, 5)\n"
+            "b = a + 1\n"
+            "v = f(100)\n"
+            "addResult(b)\n"
+            "addResult(v)"
+        )
+        res = await self.executor_obj.execute_script(script, {"base": 10})
+        assert res["results"] == {"b": 6, "v": 110}
+        # El parámetro no sale de la función
+        assert res["variables"]["a"] == 5
+
+    @gen_test
+    async def test_22_call_stack(self):
+        """Cada llamada liga todos sus argumentos en su propio marco, y la recursión sin fin se corta con un 504"""
+        script = (
+            "function suma(a, b){\n"
+            "  r = a + b\n"
+            "  return r\n"
+            "}\n"
+            "function doble(x){\n"
+            "  d = suma(x, x)\n"
+            "  return d\n"
+            "}\n"
+            "v = suma(2, 3)\n"
+            "w = doble(v)\n"
+            "addResult(v)\n"
+            "addResult(w)"
+        )
+        res = await self.executor_obj.execute_script(script, {})
+        assert res["results"] == {"v": 5, "w": 10}
+
+        payload = {
+            "script": "function bucle(n){\n  m = bucle(n)\n  return m\n}\nz = bucle(1)\naddResult(z)",
+            "variables": {}
+        }
+        response = await self.http_client.fetch(
+            self.get_url("/api/v1/execute"),
+            method="POST",
+            body=json.dumps(payload),
+            raise_error=False
+        )
+        assert response.code == 504
+        assert "call depth" in json.loads(response.body)["error"]
+
+    def test_23_bytecode_v2(self):
+        """El paquete v2 trae el code object ya compilado y los metadatos firmados; v1 se sigue aceptando"""
+        interface = [{"item": "targetVarName", "type": "variable"}]
+        package = BytecodePacker.pack("x = 1", "cmd", interface, "heavy")
+        source, code, meta = BytecodePacker.read(package)
+        assert source == "x = 1"
+        namespace = {}
+        exec(code, namespace)
+        assert namespace["x"] == 1
+        assert meta["interface"] == interface and meta["heavy"] is True
+
+        # Un paquete v1 solo trae el fuente: se compila al cargarlo
+        v1_payload = b"x = 1"
+        v1_header = BytecodePacker.HEADER_V1.pack(BytecodePacker.MAGIC, 1, len(v1_payload))
+        v1 = v1_header + hmac.new(BytecodePacker.SECRET_KEY, v1_header + v1_payload, hashlib.sha256).digest() + v1_payload
+        assert BytecodePacker.read(v1) == ("x = 1", None, {})
+
+        # Los metadatos van firmados
+        tampered = package.replace(b'"heavy":true', b'"heavy":fals')
+        with pytest.raises(ValueError):
+            BytecodePacker.read(tampered)
+
+    @gen_test
+    async def test_24_db_catalog_bulk_load(self):
+        """El catálogo de respaldo en BD se carga entero en L1 y queda guardado en v2"""
+        await self.executor_obj.load_db_catalog()
+        assert "addVar" in self.executor_obj.db_commands
+
+        async with self.pool.acquire() as conn:
+            row = await conn.fetchrow(
+                "SELECT bytecode FROM avap_bytecode WHERE command_name = $1",
+                "addVar"
+            )
+            assert BytecodePacker.version_of(row['bytecode']) == BytecodePacker.VERSION
+
+    @gen_test
+    async def test_25_explicit_branch(self):
+        """El if del catálogo nombra la rama en task['branch'], aunque lea las ramas en otro orden"""
+        code = (
+            "task['branch'] = 'true' if task['properties']['variable'] == 'si' else 'false'\n"
+            "for name in ('true', 'false'):\n"
+            "    task['branches'].get(name)"
+        )
+        bytecode = BytecodePacker.pack(code, "if")
+        self.executor_obj.command_cache["if"] = CatalogCommand.verify("if", bytecode, [
+            {"item": "variable"}, {"item": "variableValue"}, {"item": "comparator"}
+        ], self.executor_obj.catalog_version)
+        script = "if(si, 1, =)\n  r = 1\nelse()\n  r = 2\nend()\naddResult(r)"
+        res = await self.executor_obj.execute_script(script, {})
+        assert res["results"]["r"] == 1
+
+    def test_26_native_reference_commands(self):
+        """La VM nativa solo sustituye if/addVar/addResult si el catálogo trae los fuentes de referencia"""
+        executor = self.executor_obj
+        for name, source_hash in NATIVE_REFERENCE.items():
+            assert executor.command_cache[name].source_hash == source_hash
+        lowering = NativeLowering(executor._catalog_command, executor.catalog_generation)
+        assert all(lowering.reference(name) for name in NATIVE_REFERENCE)
+
+        # Otra implementación con el mismo nombre vuelve al executor
+        bytecode = BytecodePacker.pack("task['properties']['targetVarName']", "addVar")
+        executor.command_cache["addVar"] = CatalogCommand.verify(
+            "addVar", bytecode, [{"item": "targetVarName"}, {"item": "varValue"}], executor.catalog_version
+        )
+        assert not lowering.reference("addVar")
+
+    @gen_test
+    async def test_27_parallel_sandbox_commands(self):
+        """Dos comandos heavy agrupados en paralelo devuelven del sandbox solo lo que cambian"""
+        code = "self.conector.variables[task['properties']['o_result']] = task['properties']['value']"
+        bytecode = BytecodePacker.pack(code, "Fetch", command_type="io", parallel_safe=True)
+        self.executor_obj.command_cache["Fetch"] = CatalogCommand.verify("Fetch", bytecode, [
+            {"item": "value"}, {"item": "o_result"}
+        ], self.executor_obj.catalog_version)
+        self.executor_obj.start_sandbox(2)
+        try:
+            script = "addVar(a, 0)\naddVar(b, 0)\nFetch(1, a)\nFetch(2, b)\naddResult(a)\naddResult(b)"
+            res = await self.executor_obj.execute_script(script, {})
+        finally:
+            self.executor_obj.sandbox.close()
+            self.executor_obj.sandbox = None
+        assert res["results"] == {"a": 1, "b": 2}
+
+    def test_28_plan_cache_rejected_replacement(self):
+        """Si el plan nuevo no entra en caché, el anterior del mismo script se conserva"""
+        small = self.executor_obj.get_plan("addVar(a, 1)")
+        big = self.executor_obj.get_plan("addVar(a, 1)\naddVar(b, 2)\naddVar(c, 3)")
+        # Cabe X grande o X e Y pequeños, pero no X grande junto a Y
+        cache = PlanCache(PlanCache.estimate_size("X", big) + PlanCache.estimate_size("Y", small) - 1)
+        for _ in range(10):
+            cache.get("Y")
+        cache.get("X")
+        cache.put("X", small)
+        cache.put("Y", small)
+        # Y es más frecuente: el plan grande de X se rechaza
+        assert not cache.put("X", big)
+        assert cache.get("X") is small
+        assert cache.size == sum(size for _, size in cache.entries.values())
+
+    def test_29_heavy_follows_type(self):
+        """Un comando deja de ser heavy si su tipo o su código cambian"""
+        io = BytecodePacker.pack("x = 1", "cmd", [], "io")
+        command = CatalogCommand.verify("cmd", io, [], "v1", command_type="io")
+        assert command.heavy
+        reused = CatalogCommand.verify("cmd", io, [], "v1", previous=command, command_type="function")
+        assert reused is command and not reused.heavy
+
+        command.heavy = True  # aprendido por tiempo de ejecución
+        changed = CatalogCommand.verify("cmd", BytecodePacker.pack("x = 2", "cmd"), [], "v1", previous=command)
+        assert not changed.heavy